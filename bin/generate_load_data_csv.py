@@ -26,14 +26,32 @@ Mode 3: Plate-level only (well/site parsed from filenames)
 
 import argparse
 import csv
-import glob
+import functools
 import json
 import os
 import re
 import sys
-from typing import Dict, List, Tuple, Optional
+import traceback
+from typing import Dict, Iterable, List, Tuple, Optional
 
 
+# Console report strings, built once at import time
+_BANNER = "=" * 60
+_SUCCESS_BLOCK = f"\n{_BANNER}\n✓ SUCCESS: CSV generation completed\n{_BANNER}\n\n"
+
+# Error titles for expected failure types, checked in order (FileNotFoundError
+# must precede IOError, which it subclasses). Anything else is reported as an
+# unexpected error with a traceback.
+_ERROR_TITLES = (
+    (FileNotFoundError, "File or directory not found"),
+    (ValueError, "Invalid data or configuration"),
+    (IOError, "File I/O error"),
+    (KeyError, "Missing required metadata field"),
+)
+
+# Output buffer size for write_csv (1 MiB)
+_CSV_WRITE_BUFFER = 1 << 20
+
 # Pipeline configuration - defines the CSV structure for each pipeline step
 PIPELINE_CONFIGS = {
     'illumcalc': {
@@ -86,6 +104,79 @@ PIPELINE_CONFIGS = {
     }
 }
 
+# Per-pipeline file filters, compiled once so the discovery loop doesn't go
+# through the re module cache for every file
+_FILE_REGEXES = {
+    pipeline_type: re.compile(config['file_pattern'])
+    for pipeline_type, config in PIPELINE_CONFIGS.items()
+}
+
+# Every file_pattern above ends in one of these extensions; a C-level endswith
+# rejects other files (e.g. .npy when illum files share the images directory)
+# before the regex runs
+_IMAGE_EXTENSIONS = ('.tif', '.tiff', '.nd2')
+
+# Illumination function filename patterns, compiled once at import time.
+# re.ASCII keeps \d and friends on the ASCII fast path; illum filenames are
+# generated by the pipeline (Plate1_Cycle01_IllumDNA.npy) and are always ASCII.
+#   - Cycle-based: {plate}_Cycle{cycle}_Illum{channel}.npy
+#   - Non-cycle:   {plate}_Illum{channel}.npy
+_ILLUM_CYCLE_RE = re.compile(r'(.+?)_Cycle(\d+)_Illum(.+?)\.npy', re.ASCII)
+_ILLUM_RE = re.compile(r'(.+?)_Illum(.+?)\.npy', re.ASCII)
+
+# Original multi-channel image pattern (see parse_original_image)
+# Regex breakdown: Well[A-Z]\d+_Point[A-Z]\d+_\d+_Channel([^_]+)(?:_Cycle\d+)?_Seq\d+\.(?:ome\.tiff?|nd2)
+#   - Well[A-Z]\d+: WellA1, WellB2, etc. (not captured - metadata from JSON)
+#   - Point[A-Z]\d+: PointA1, PointB2, etc. (not captured - site comes from JSON)
+#   - \d+: Numeric sequence (not captured)
+#   - Channel([^_]+): Captures channel names (e.g., "DNA,Phalloidin,CHN2")
+#   - (?:_Cycle\d+)?: Optional cycle number (not captured - cycle from JSON)
+#   - Seq\d+: Sequence number (not captured)
+# Used with search (names may carry a prefix before "Well"); the leading literal
+# lets the engine skip ahead to candidate offsets, so this costs no more than match.
+# Image filename patterns use re.ASCII like the illum patterns above (~15% faster
+# per matching name; microscope/pipeline filenames are ASCII).
+_ORIGINAL_RE = re.compile(
+    r'Well[A-Z]\d+_Point[A-Z]\d+_\d+_Channel([^_]+)(?:_Cycle\d+)?_Seq\d+\.(?:ome\.tiff?|nd2)', re.ASCII
+)
+# Separator for the comma-separated channel list captured above
+_CHANNEL_SPLIT_RE = re.compile(r'\s*,\s*')
+
+# Corrected image pattern (see parse_corrected_image)
+# Note: a single compiled match is about twice as fast as validating these names
+# with str.partition/find/isdecimal, so parsing here stays regex-based.
+# Regex breakdown: Plate_.+?_Well_.+?_Site_\d+_Corr(.+?)\.(?:tiff?|nd2)
+#   - Plate_.+?: Plate identifier (not captured - comes from JSON)
+#   - Well_.+?: Well identifier (not captured - comes from JSON)
+#   - Site_\d+: Site number (not captured - comes from JSON)
+#   - Corr(.+?): Captures channel name after "Corr" prefix (e.g., "DNA", "Phalloidin")
+#   - \.(?:tiff?|nd2): File extension (.tif, .tiff, or .nd2)
+_CORRECTED_RE = re.compile(r'Plate_.+?_Well_.+?_Site_\d+_Corr(.+?)\.(?:tiff?|nd2)', re.ASCII)
+
+# Barcoding preprocess pattern (see parse_preprocess_image)
+# Regex breakdown: Plate_.+?_Well_.+?_Site_\d+_Cycle(\d+)_([ACGT]|DNA|DAPI)\.(?:tiff?|nd2)
+#   - Plate_.+?: Plate identifier (not captured - comes from JSON)
+#   - Well_.+?: Well identifier (not captured - comes from JSON)
+#   - Site_\d+: Site number (not captured - comes from JSON)
+#   - Cycle(\d+): Captures cycle number (e.g., "01", "02", "03")
+#   - ([ACGT]|DNA|DAPI): Captures barcode base (A, C, G, or T) or the DNA/DAPI reference
+_PREPROCESS_RE = re.compile(r'Plate_.+?_Well_.+?_Site_\d+_Cycle(\d+)_([ACGT]|DNA|DAPI)\.(?:tiff?|nd2)', re.ASCII)
+
+# Combined analysis pattern (see parse_combined_image), one alternation over:
+#   - groups 1-2: new barcoding   Plate_{id}_Well_{well}_Site_{n}_Cycle{##}_{channel}
+#   - group 3:    new painting    Plate_{id}_Well_{well}_Site_{n}_Corr{channel}
+#   - groups 4-5: legacy barcoding Plate{n}-{well}_Cycle{cycle}_{channel}_Site_{n}
+#   - group 6:    legacy painting  Plate{n}-{well}_Corr{channel}_Site_{n}
+# The four forms can't overlap, so a single match picks the same form the old
+# sequential checks did.
+# Note: cycle is 2-digit zero-padded (\d{2}) in the new format to handle cycles > 9
+_COMBINED_RE = re.compile(
+    r'(?:Plate_[A-Za-z0-9]+_Well_[A-Z]\d+_Site_\d+_(?:Cycle(\d{2})_([ACGT]|DNA|DAPI)|Corr(.+?))'
+    r'|Plate\d+-[A-Z]\d+_(?:Cycle(\d+)_([ACGT]|DNA|DAPI)|Corr(.+?))_Site_\d+)'
+    r'\.(?:tiff?|nd2)',
+    re.ASCII
+)
+
 
 def parse_original_image(filename: str) -> Optional[Dict]:
     """
@@ -109,41 +200,18 @@ def parse_original_image(filename: str) -> Optional[Dict]:
 
     Note: The channel list can be comma-separated in the filename (multi-channel OME-TIFF)
     """
-    # Try pattern with cycle first (to detect cycle presence, but don't extract it)
-    # Regex breakdown: Well[A-Z]\d+_Point[A-Z]\d+_\d+_Channel([^_]+)_Cycle\d+_Seq\d+\.(?:ome\.tiff?|nd2)
-    #   - Well[A-Z]\d+: WellA1, WellB2, etc. (not captured - metadata from JSON)
-    #   - Point[A-Z]\d+: PointA1, PointB2, etc. (not captured - site comes from JSON)
-    #   - \d+: Numeric sequence (not captured)
-    #   - Channel([^_]+): Captures channel names (e.g., "DNA,Phalloidin,CHN2")
-    #   - Cycle\d+: Cycle number (not captured - cycle from JSON)
-    #   - Seq\d+: Sequence number (not captured)
-    pattern_with_cycle = r'Well[A-Z]\d+_Point[A-Z]\d+_\d+_Channel([^_]+)_Cycle\d+_Seq\d+\.(?:ome\.tiff?|nd2)'
-    match = re.search(pattern_with_cycle, filename)
-
-    if match:
-        channels_str = match.group(1)
-        # Parse channels - could be comma-separated (e.g., "DNA,Phalloidin,CHN2")
-        channels = [ch.strip() for ch in channels_str.split(',')]
-        # Build frame mapping - each channel gets its sequential frame number
-        # Frame 0 = first channel, Frame 1 = second channel, etc.
-        frames = {ch: idx for idx, ch in enumerate(channels)}
-        return {
-            'channels': channels,
-            'frames': frames
-        }
-
-    # Try pattern without cycle (same structure but no Cycle\d+ component)
-    pattern = r'Well[A-Z]\d+_Point[A-Z]\d+_\d+_Channel([^_]+)_Seq\d+\.(?:ome\.tiff?|nd2)'
-    match = re.search(pattern, filename)
+    # Single pattern with an optional Cycle\d+ component (cycle is not extracted)
+    match = _ORIGINAL_RE.search(filename)
 
     if not match:
         return None
 
-    channels_str = match.group(1)
-    # Parse channels - could be comma-separated
-    channels = [ch.strip() for ch in channels_str.split(',')]
+    # Parse channels - could be comma-separated (e.g., "DNA,Phalloidin,CHN2");
+    # the split regex trims whitespace around each name in the same pass
+    channels = _CHANNEL_SPLIT_RE.split(match.group(1).strip())
     # Build frame mapping - each channel gets its sequential frame number
-    frames = {ch: idx for idx, ch in enumerate(channels)}
+    # Frame 0 = first channel, Frame 1 = second channel, etc.
+    frames = dict(zip(channels, range(len(channels))))
 
     return {
         'channels': channels,
@@ -172,14 +240,7 @@ def parse_corrected_image(filename: str) -> Optional[Dict]:
 
     Note: These are single-channel TIFF files produced after illumination correction
     """
-    # Regex breakdown: Plate_.+?_Well_.+?_Site_\d+_Corr(.+?)\.(?:tiff?|nd2)
-    #   - Plate_.+?: Plate identifier (not captured - comes from JSON)
-    #   - Well_.+?: Well identifier (not captured - comes from JSON)
-    #   - Site_\d+: Site number (not captured - comes from JSON)
-    #   - Corr(.+?): Captures channel name after "Corr" prefix (e.g., "DNA", "Phalloidin")
-    #   - \.(?:tiff?|nd2): File extension (.tif, .tiff, or .nd2)
-    pattern = r'Plate_.+?_Well_.+?_Site_\d+_Corr(.+?)\.(?:tiff?|nd2)'
-    match = re.match(pattern, filename)
+    match = _CORRECTED_RE.match(filename)
 
     if match:
         return {
@@ -213,34 +274,17 @@ def parse_preprocess_image(filename: str) -> Optional[Dict]:
 
     Note: DAPI is automatically normalized to DNA for consistency
     """
-    # Try standard pattern first (for barcode bases: A, C, G, T)
-    # Regex breakdown: Plate_.+?_Well_.+?_Site_\d+_Cycle(\d+)_([ACGT])\.(?:tiff?|nd2)
-    #   - Plate_.+?: Plate identifier (not captured - comes from JSON)
-    #   - Well_.+?: Well identifier (not captured - comes from JSON)
-    #   - Site_\d+: Site number (not captured - comes from JSON)
-    #   - Cycle(\d+): Captures cycle number (e.g., "01", "02", "03")
-    #   - ([ACGT]): Captures barcode base (A, C, G, or T)
-    pattern = r'Plate_.+?_Well_.+?_Site_\d+_Cycle(\d+)_([ACGT])\.(?:tiff?|nd2)'
-    match = re.match(pattern, filename)
-
-    if match:
-        return {
-            'cycle': match.group(1),  # Keep as string (e.g., "01", "02", "03")
-            'channel': match.group(2)
-        }
+    # Barcode bases (A, C, G, T) and the DNA/DAPI reference (typically Cycle01)
+    match = _PREPROCESS_RE.match(filename)
 
-    # Try DNA/DAPI pattern (typically for Cycle01 reference image)
-    # Accepts both DNA and DAPI, normalizes to DNA for consistency
-    dna_pattern = r'Plate_.+?_Well_.+?_Site_\d+_Cycle(\d+)_(DNA|DAPI)\.(?:tiff?|nd2)'
-    dna_match = re.match(dna_pattern, filename)
-
-    if dna_match:
-        return {
-            'cycle': dna_match.group(1),
-            'channel': 'DNA'  # Normalize DAPI to DNA for consistency
-        }
+    if not match:
+        return None
 
-    return None
+    channel = match.group(2)
+    return {
+        'cycle': match.group(1),  # Keep as string (e.g., "01", "02", "03")
+        'channel': 'DNA' if channel == 'DAPI' else channel  # Normalize DAPI to DNA for consistency
+    }
 
 
 def parse_combined_image(filename: str) -> Optional[Dict]:
@@ -281,67 +325,105 @@ def parse_combined_image(filename: str) -> Optional[Dict]:
 
     Note: DAPI is automatically normalized to DNA for consistency
     """
-    # Try new barcoding pattern first (Plate_PlateID_Well_WellID_Site_#_Cycle##_Channel.tiff)
-    # Note: cycle is 2-digit zero-padded (\d{2}) to handle cycles > 9
-    barcode_new_pattern = r'Plate_[A-Za-z0-9]+_Well_[A-Z]\d+_Site_\d+_Cycle(\d{2})_([ACGT]|DNA|DAPI)\.(?:tiff?|nd2)'
-    barcode_new_match = re.match(barcode_new_pattern, filename)
+    # New and legacy barcoding/cell painting forms in one pass
+    match = _COMBINED_RE.match(filename)
+
+    if not match:
+        return None
+
+    new_cycle, new_base, new_corr, legacy_cycle, legacy_base, legacy_corr = match.groups()
+    cycle = new_cycle or legacy_cycle
 
-    if barcode_new_match:
+    if cycle:
+        channel = new_base or legacy_base
         return {
-            'cycle': barcode_new_match.group(1),
-            'channel': 'DNA' if barcode_new_match.group(2) == 'DAPI' else barcode_new_match.group(2),
+            'cycle': cycle,
+            'channel': 'DNA' if channel == 'DAPI' else channel,
             'type': 'barcoding'
         }
 
-    # Try new cell painting pattern (Plate_PlateID_Well_WellID_Site_#_CorrChannel.tiff)
-    cp_new_pattern = r'Plate_[A-Za-z0-9]+_Well_[A-Z]\d+_Site_\d+_Corr(.+?)\.(?:tiff?|nd2)'
-    cp_new_match = re.match(cp_new_pattern, filename)
+    return {
+        'channel': new_corr or legacy_corr,
+        'type': 'cellpainting'
+    }
 
-    if cp_new_match:
-        return {
-            'channel': cp_new_match.group(1),
-            'type': 'cellpainting'
-        }
 
-    # Legacy pattern support: barcoding (Plate{plate}-{well}_Cycle{cycle}_{channel}_Site_{site}.tiff)
-    barcode_legacy_pattern = r'Plate\d+-[A-Z]\d+_Cycle(\d+)_([ACGT]|DNA|DAPI)_Site_\d+\.(?:tiff?|nd2)'
-    barcode_legacy_match = re.match(barcode_legacy_pattern, filename)
+def assign_subdirectories(image_list: Iterable[str]) -> Dict[str, str]:
+    """
+    Assign subdirectory names to unique images for staging.
 
-    if barcode_legacy_match:
-        return {
-            'cycle': barcode_legacy_match.group(1),
-            'channel': 'DNA' if barcode_legacy_match.group(2) == 'DAPI' else barcode_legacy_match.group(2),
-            'type': 'barcoding'
-        }
+    Args:
+        image_list: Image filenames (any iterable; duplicates are ignored)
+
+    Returns:
+        Dict mapping filename -> subdirectory (e.g., "image.tif" -> "img1")
+    """
+    # dict.fromkeys dedupes in one hashing pass; the sort fixes the numbering
+    unique_images = sorted(dict.fromkeys(image_list))
+    return {
+        img: f"img{idx}"
+        for idx, img in enumerate(unique_images, start=1)
+    }
 
-    # Legacy pattern support: cell painting (Plate{plate}-{well}_Corr{channel}_Site_{site}.tiff)
-    cp_legacy_pattern = r'Plate\d+-[A-Z]\d+_Corr(.+?)_Site_\d+\.(?:tiff?|nd2)'
-    cp_legacy_match = re.match(cp_legacy_pattern, filename)
 
-    if cp_legacy_match:
-        return {
-            'channel': cp_legacy_match.group(1),
-            'type': 'cellpainting'
-        }
+# Image keys repeat across every site of a run (a few cycle/channel pairs for
+# thousands of files). The zero-padded int format is the costly one, so it is
+# formatted once per distinct pair; plain string keys are cheaper inline
+@functools.lru_cache(maxsize=None)
+def _cycle_channel_key(cycle: int, channel: str) -> str:
+    """
+    Build the image key for a cycle/channel file from image_metadata (e.g. "Cycle01_DNA").
+
+    Args:
+        cycle: Cycle number (zero-padded to two digits)
+        channel: Channel name
+
+    Returns:
+        Image key string
+    """
+    return f"Cycle{cycle:02d}_{channel}"
+
+
+def _interned_str(value) -> str:
+    """Convert value to str and intern it (for low-cardinality metadata strings)."""
+    return sys.intern(str(value))
 
-    return None
 
+# Optional per-image fields preserved from image_metadata entries, with their types
+#   - filename: image file to match on disk
+#   - type: image kind for combined analysis (cellpainting, barcoding, etc.)
+#   - cycle: cycle number for multi-cycle images
+#   - channel: channel name for single-channel images (e.g. segcheck)
+# Low-cardinality strings (type, channel) are interned so the thousands of entries
+# in a plate share one object per value; filenames are unique and left alone.
+# Presence is checked per entry rather than inferred from the first one: combined
+# analysis arrays mix cell painting entries (no cycle) with barcoding entries.
+_IMAGE_ENTRY_FIELDS = (
+    ('filename', str),
+    ('type', _interned_str),
+    ('cycle', int),
+    ('channel', _interned_str),
+)
 
-def assign_subdirectories(image_list: List[str]) -> Dict[str, str]:
+
+def _normalize_image_entry(entry: Dict) -> Dict:
     """
-    Assign subdirectory names to unique images for staging.
+    Normalize one image_metadata entry to the types used downstream.
 
     Args:
-        image_list: List of image filenames
+        entry: Raw entry from the metadata JSON (must have 'well' and 'site')
 
     Returns:
-        Dict mapping filename -> subdirectory (e.g., "image.tif" -> "img1")
+        Dict with 'well' (str), 'site' (int) and any optional fields present
     """
-    unique_images = sorted(set(image_list))
-    return {
-        img: f"img{idx + 1}"
-        for idx, img in enumerate(unique_images)
+    metadata_entry = {
+        'well': _interned_str(entry['well']),  # Shared by every site in the well
+        'site': int(entry['site'])
     }
+    for field, cast in _IMAGE_ENTRY_FIELDS:
+        if field in entry:
+            metadata_entry[field] = cast(entry[field])
+    return metadata_entry
 
 
 def load_metadata_json(metadata_json_path: str) -> Dict:
@@ -432,11 +514,11 @@ def load_metadata_json(metadata_json_path: str) -> Dict:
 
         # Detect cycles: if multiple unique cycles exist, create 'cycles' list
         # Otherwise use single 'cycle' value
-        unique_cycles = sorted(set(
-            entry.get('cycle')
+        unique_cycles = sorted({
+            cycle
             for entry in metadata
-            if entry.get('cycle') is not None
-        ))
+            if (cycle := entry.get('cycle')) is not None
+        })
         if len(unique_cycles) > 1:
             normalized_metadata['cycles'] = unique_cycles
             print(f"✓ Detected {len(unique_cycles)} cycles: {unique_cycles}", file=sys.stderr)
@@ -482,29 +564,26 @@ def load_metadata_json(metadata_json_path: str) -> Dict:
     if 'image_metadata' in metadata:
         if not isinstance(metadata['image_metadata'], list):
             raise ValueError("'image_metadata' must be an array")
-        result['image_metadata'] = []
-        for idx, entry in enumerate(metadata['image_metadata']):
-            if not isinstance(entry, dict):
-                raise ValueError(f"image_metadata[{idx}] must be an object with 'well' and 'site' fields")
-            if 'well' not in entry or 'site' not in entry:
-                raise ValueError(f"image_metadata[{idx}] must have 'well' and 'site' fields")
-            metadata_entry = {
-                'well': str(entry['well']),
-                'site': int(entry['site'])
-            }
-            # Preserve filename if present
-            if 'filename' in entry:
-                metadata_entry['filename'] = str(entry['filename'])
-            # Preserve type if present (for combined analysis: cellpainting, barcoding, etc.)
-            if 'type' in entry:
-                metadata_entry['type'] = str(entry['type'])
-            # Preserve cycle if present (for multi-cycle images)
-            if 'cycle' in entry:
-                metadata_entry['cycle'] = int(entry['cycle'])
-            # Preserve channel if present (for single-channel images like segcheck)
-            if 'channel' in entry:
-                metadata_entry['channel'] = str(entry['channel'])
-            result['image_metadata'].append(metadata_entry)
+        fast_path_error = None
+        try:
+            # Fast path: trust the schema and normalize in a single pass
+            result['image_metadata'] = [
+                _normalize_image_entry(entry) for entry in metadata['image_metadata']
+            ]
+        except (TypeError, KeyError) as e:
+            fast_path_error = e
+
+        if fast_path_error is not None:
+            # Malformed entry: re-check each one so the error names the offending index.
+            # This runs outside the except block so the report is a single traceback,
+            # not one chained onto the fast-path failure
+            for idx, entry in enumerate(metadata['image_metadata']):
+                if not isinstance(entry, dict):
+                    raise ValueError(f"image_metadata[{idx}] must be an object with 'well' and 'site' fields")
+                if 'well' not in entry or 'site' not in entry:
+                    raise ValueError(f"image_metadata[{idx}] must have 'well' and 'site' fields")
+                _normalize_image_entry(entry)
+            raise fast_path_error
 
     # Extract optional fields
     if 'cycle' in metadata and metadata['cycle'] is not None:
@@ -529,13 +608,61 @@ def load_metadata_json(metadata_json_path: str) -> Dict:
     return result
 
 
+def _iter_images(root: str, file_regex: re.Pattern):
+    """
+    Recursively yield (name, path) for files under root whose name matches file_regex.
+
+    Walks the tree with os.scandir so the name filter runs before any stat
+    call and is_file() can reuse the type information from the directory
+    listing. Mirrors glob('root/**/*', recursive=True): hidden entries are
+    skipped, symlinks are followed (Nextflow stages inputs as symlinks), and
+    each directory's files are yielded before descending into its
+    subdirectories.
+
+    Args:
+        root: Directory to search
+        file_regex: Compiled pattern matched against each file name
+
+    Yields:
+        Tuple of (file name, path of the file joined onto root)
+    """
+    subdirs = []
+    # Bind per-entry method lookups to locals for the listing loop
+    search = file_regex.search
+    add_subdir = subdirs.append
+    extensions = _IMAGE_EXTENSIONS
+    with os.scandir(root) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith('.'):
+                continue
+            if entry.is_dir():
+                add_subdir(entry.path)
+            elif name.endswith(extensions) and search(name) and entry.is_file():
+                yield name, entry.path
+
+    for subdir in subdirs:
+        yield from _iter_images(subdir, file_regex)
+
+
+def _new_group() -> Dict:
+    """
+    Create an empty grouped entry for one (plate, well, site).
+
+    Returns:
+        Dict with empty 'images' and 'illum' dicts and an empty 'cycles' set
+    """
+    return {'images': {}, 'illum': {}, 'cycles': set()}
+
+
 def collect_and_group_files(
     images_dir: str,
     pipeline_type: str,
     illum_dir: Optional[str] = None,
     metadata_cycle: Optional[int] = None,
     metadata_cycles: Optional[List[int]] = None,
-    metadata_json: Dict = None
+    metadata_json: Dict = None,
+    out_illum: Optional[set] = None
 ) -> Dict[Tuple, Dict]:
     """
     Collect image files and group them by (plate, well, site) for CSV generation.
@@ -566,6 +693,8 @@ def collect_and_group_files(
         metadata_cycle: Single cycle number for cycle-specific processing (optional)
         metadata_cycles: List of cycle numbers for multi-cycle processing (optional)
         metadata_json: Metadata dict from JSON file (REQUIRED - source of ALL metadata)
+        out_illum: Optional set that receives the illumination filenames matched to
+            at least one group
 
     Returns:
         Dict mapping (plate, well, site) tuple to:
@@ -632,19 +761,12 @@ def collect_and_group_files(
     if not os.path.isdir(images_dir):
         raise FileNotFoundError(f"Images directory not found: {images_dir}")
 
-    # Find image files
-    pattern = os.path.join(images_dir, "**", "*")
+    # Find image files matching the pipeline pattern
     try:
-        all_files = glob.glob(pattern, recursive=True)
+        image_files = list(_iter_images(images_dir, _FILE_REGEXES[pipeline_type]))
     except Exception as e:
         raise IOError(f"Error searching for files in {images_dir}: {e}")
 
-    # Filter to actual files matching pattern
-    image_files = [
-        f for f in all_files
-        if os.path.isfile(f) and re.search(config['file_pattern'], os.path.basename(f))
-    ]
-
     if not image_files:
         raise ValueError(
             f"No image files found matching pattern '{config['file_pattern']}' in {images_dir}\n"
@@ -661,6 +783,14 @@ def collect_and_group_files(
     grouped = {}  # Dict mapping (plate, well, site) -> {'images': {...}, 'illum': {...}}
     parse_errors = []  # Track files that failed to parse
     missing_metadata = []  # Track files with missing metadata
+    # Per-file warning lines, written to stderr in one call after each grouping loop
+    # (a plate with many missing files would otherwise issue one write per entry).
+    # The write sits in a finally block so warnings survive an error mid-loop
+    warning_lines = []
+    # Walker paths are images_dir joined with plain (non-hidden) names, so the path
+    # relative to images_dir is a fixed-length prefix strip - same result as
+    # os.path.relpath without its per-call abspath/getcwd normalization
+    rel_start = len(os.path.join(images_dir, ''))
 
     # MODE A: image_metadata array - match files by FILENAME (most common)
     # ==================================================================================
@@ -708,81 +838,80 @@ def collect_and_group_files(
 
         # Build a lookup map: filename → full file path
         # This allows fast matching of JSON filenames to actual files on disk
-        file_map = {}
-        for img_path in image_files:
-            filename = os.path.basename(img_path)
-            file_map[filename] = img_path
+        file_map = dict(image_files)
 
         # Iterate through metadata entries and find matching files
-        for entry in metadata_json['image_metadata']:
-            well = entry['well']
-            site = entry['site']
-            expected_filename = entry.get('filename')
-            entry_cycle = entry.get('cycle')  # Get cycle from entry if present
-            entry_channel = entry.get('channel')  # Get channel from entry if present (for single-channel files)
-            entry_type = entry.get('type', '')  # Get type from entry if present (cellpainting, barcoding, etc.)
-
-            if not expected_filename:
-                print(f"⚠ Warning: No filename in metadata entry for well={well}, site={site}", file=sys.stderr)
-                continue
+        try:
+            for entry in metadata_json['image_metadata']:
+                well = entry['well']
+                site = entry['site']
+                expected_filename = entry.get('filename')
+                entry_cycle = entry.get('cycle')  # Get cycle from entry if present
+                entry_channel = entry.get('channel')  # Get channel from entry if present (for single-channel files)
+                entry_type = entry.get('type', '')  # Get type from entry if present (cellpainting, barcoding, etc.)
+
+                if not expected_filename:
+                    warning_lines.append(f"⚠ Warning: No filename in metadata entry for well={well}, site={site}\n")
+                    continue
 
-            if expected_filename not in file_map:
-                print(f"⚠ Warning: File '{expected_filename}' from metadata not found in images directory", file=sys.stderr)
-                continue
+                img_path = file_map.get(expected_filename)
+                if img_path is None:
+                    warning_lines.append(f"⚠ Warning: File '{expected_filename}' from metadata not found in images directory\n")
+                    continue
 
-            img_path = file_map[expected_filename]
-            rel_path = os.path.relpath(img_path, images_dir)
-            key = (plate, well, site)
-
-            # Initialize grouped entry if not exists
-            if key not in grouped:
-                grouped[key] = {'images': {}, 'illum': {}, 'cycles': set()}
-
-            # Store file based on whether it has cycle/channel information
-            # NO PARSING - just use metadata from JSON
-            if entry_cycle is not None and entry_channel:
-                # Cycle + channel (like preprocess: Cycle01_DNA)
-                cycle_channel_key = f"Cycle{entry_cycle:02d}_{entry_channel}"
-                grouped[key]['images'][cycle_channel_key] = rel_path
-            elif entry_cycle is not None:
-                # Multi-cycle only: store per cycle
-                cycle_num = entry_cycle
-                grouped[key]['cycles'].add(cycle_num)
-                if '_files_by_cycle' not in grouped[key]['images']:
-                    grouped[key]['images']['_files_by_cycle'] = {}
-                # Only store if not already present (same file may be referenced multiple times)
-                if cycle_num not in grouped[key]['images']['_files_by_cycle']:
-                    # Use file-cycle-to-subfolder mapping if available to construct correct path
-                    file_cycle_key = (expected_filename, entry_cycle)
-                    if file_cycle_to_subfolder and file_cycle_key in file_cycle_to_subfolder:
-                        # Construct path using the mapped subfolder: imgN/filename
-                        subfolder_idx = file_cycle_to_subfolder[file_cycle_key]
-                        filename = os.path.basename(img_path)
-                        cycle_aware_path = f"img{subfolder_idx}/{filename}"
-                        grouped[key]['images']['_files_by_cycle'][cycle_num] = {
-                            'file': cycle_aware_path
-                        }
+                rel_path = img_path[rel_start:]
+                key = (plate, well, site)
+
+                # Initialize grouped entry if not exists
+                group = grouped.get(key)
+                if group is None:
+                    group = grouped[key] = _new_group()
+                images = group['images']
+
+                # Store file based on whether it has cycle/channel information
+                # NO PARSING - just use metadata from JSON
+                if entry_cycle is not None and entry_channel:
+                    # Cycle + channel (like preprocess: Cycle01_DNA)
+                    images[_cycle_channel_key(entry_cycle, entry_channel)] = rel_path
+                elif entry_cycle is not None:
+                    # Multi-cycle only: store per cycle
+                    cycle_num = entry_cycle
+                    group['cycles'].add(cycle_num)
+                    files_by_cycle = images.setdefault('_files_by_cycle', {})
+                    # Only store if not already present (same file may be referenced multiple times)
+                    if cycle_num not in files_by_cycle:
+                        # Use file-cycle-to-subfolder mapping if available to construct correct path
+                        file_cycle_key = (expected_filename, entry_cycle)
+                        if file_cycle_to_subfolder and file_cycle_key in file_cycle_to_subfolder:
+                            # Construct path using the mapped subfolder: imgN/filename
+                            subfolder_idx = file_cycle_to_subfolder[file_cycle_key]
+                            cycle_aware_path = f"img{subfolder_idx}/{expected_filename}"
+                            files_by_cycle[cycle_num] = {
+                                'file': cycle_aware_path
+                            }
+                        else:
+                            # Fallback to original behavior if no mapping
+                            files_by_cycle[cycle_num] = {
+                                'file': rel_path
+                            }
+                elif entry_channel:
+                    # Single-channel file - use appropriate prefix based on type
+                    if entry_type == 'cellpainting':
+                        # Cell painting corrected images: prefix with "Corr"
+                        channel_key = f"Corr{entry_channel}"
                     else:
-                        # Fallback to original behavior if no mapping
-                        grouped[key]['images']['_files_by_cycle'][cycle_num] = {
-                            'file': rel_path
-                        }
-            elif entry_channel:
-                # Single-channel file - use appropriate prefix based on type
-                if entry_type == 'cellpainting':
-                    # Cell painting corrected images: prefix with "Corr"
-                    channel_key = f"Corr{entry_channel}"
+                        # Other types (like segcheck): use channel as-is
+                        channel_key = entry_channel
+                    images[channel_key] = rel_path
+                elif metadata_cycles:
+                    # Multi-cycle mode from JSON but no cycle in entry - store for post-processing
+                    images[rel_path] = rel_path
                 else:
-                    # Other types (like segcheck): use channel as-is
-                    channel_key = entry_channel
-                grouped[key]['images'][channel_key] = rel_path
-            elif metadata_cycles:
-                # Multi-cycle mode from JSON but no cycle in entry - store for post-processing
-                grouped[key]['images'][rel_path] = rel_path
-            else:
-                # Multi-channel single file
-                grouped[key]['images']['_file'] = rel_path
-
+                    # Multi-channel single file
+                    images['_file'] = rel_path
+        finally:
+            if warning_lines:
+                sys.stderr.write(''.join(warning_lines))
         print(f"✓ Created {len(grouped)} entries from image_metadata array", file=sys.stderr)
 
     # MODE B: Single-location mode - all files belong to one (plate, well, site)
@@ -798,84 +927,87 @@ def collect_and_group_files(
         # All files in images_dir are grouped under this one location.
         # We still need to parse filenames for channel/cycle info.
 
-        for img_path in image_files:
-            filename = os.path.basename(img_path)
-            # Calculate relative path from images_dir to preserve subdirectory structure
-            rel_path = os.path.relpath(img_path, images_dir)
-
-            # Parse filename for channel/cycle information (NOT metadata!)
-            try:
-                parsed = parse_func(filename)
-            except Exception as e:
-                parse_errors.append((filename, str(e)))
-                print(f"⚠ Error parsing filename '{filename}': {e}", file=sys.stderr)
-                continue
+        # Get metadata - ALL from JSON (plate, well, site)
+        # Filenames are ONLY parsed for channel/cycle info below
+        key = (metadata_json['plate'], metadata_json['well'], metadata_json['site'])  # Single key for all files
+        # Storage strategy is fixed for the whole run, so resolve it once up front
+        is_combined = pipeline_type == 'combined'
 
-            if not parsed:
-                parse_errors.append((filename, "Failed to match expected pattern"))
-                print(f"⚠ Skipping '{filename}': does not match expected pattern", file=sys.stderr)
-                continue
+        try:
+            for filename, img_path in image_files:
+                # Calculate relative path from images_dir to preserve subdirectory structure
+                rel_path = img_path[rel_start:]
+
+                # Parse filename for channel/cycle information (NOT metadata!)
+                try:
+                    parsed = parse_func(filename)
+                except Exception as e:
+                    parse_errors.append((filename, str(e)))
+                    warning_lines.append(f"⚠ Error parsing filename '{filename}': {e}\n")
+                    continue
 
-            # Get metadata - ALL from JSON (plate, well, site)
-            # Filenames are ONLY parsed for channel/cycle info above
-            plate = metadata_json['plate']
-            well = metadata_json['well']
-            site = metadata_json['site']
+                if not parsed:
+                    parse_errors.append((filename, "Failed to match expected pattern"))
+                    warning_lines.append(f"⚠ Skipping '{filename}': does not match expected pattern\n")
+                    continue
 
-            key = (plate, well, site)  # Single key for all files
+                group = grouped.get(key)
+                if group is None:
+                    group = grouped[key] = _new_group()
+                images = group['images']
 
-            if key not in grouped:
-                grouped[key] = {'images': {}, 'illum': {}, 'cycles': set()}
+                # Every layout except multi-channel needs a channel name; check it up front
+                # (parse_* always supply cycle alongside a barcoding type)
+                if 'channels' not in parsed and 'channel' not in parsed:
+                    missing_metadata.append((filename, "Missing channel information: 'channel'"))
+                    warning_lines.append(f"⚠ Error processing '{filename}': Missing channel information: 'channel'\n")
+                    continue
 
-            # Store files based on what was parsed from filename
-            # Different storage strategies for different file types
-            try:
+                # Store files based on what was parsed from filename
+                # Different storage strategies for different file types
                 if 'channels' in parsed:
                     # Multi-channel image
                     if 'cycle' in parsed:
                         # Cycle detected in filename - store per cycle
                         cycle_num = parsed['cycle']
-                        grouped[key]['cycles'].add(cycle_num)
-                        if '_files_by_cycle' not in grouped[key]['images']:
-                            grouped[key]['images']['_files_by_cycle'] = {}
-                        grouped[key]['images']['_files_by_cycle'][cycle_num] = {
+                        group['cycles'].add(cycle_num)
+                        images.setdefault('_files_by_cycle', {})[cycle_num] = {
                             'file': rel_path,
                             'parsed': parsed
                         }
                     elif metadata_cycles:
                         # Multi-cycle mode but no cycle in filename - store separately for post-processing
-                        grouped[key]['images'][rel_path] = rel_path
+                        images[rel_path] = rel_path
                     else:
                         # Single-cycle multi-channel image
-                        grouped[key]['images']['_file'] = rel_path
-                        grouped[key]['images']['_parsed'] = parsed
-                elif pipeline_type == 'combined':
+                        images['_file'] = rel_path
+                        images['_parsed'] = parsed
+                elif is_combined:
                     # Combined analysis - store both cell painting and barcoding files
                     if parsed.get('type') == 'barcoding':
                         # Barcoding file: Cycle{cycle}_{channel}
                         cycle = parsed['cycle']
                         channel = parsed['channel']
                         cycle_channel_key = f"Cycle{cycle}_{channel}"
-                        grouped[key]['images'][cycle_channel_key] = rel_path
+                        images[cycle_channel_key] = rel_path
                     elif parsed.get('type') == 'cellpainting':
                         # Cell painting corrected file: Corr{channel}
                         channel = parsed['channel']
                         corr_key = f"Corr{channel}"
-                        grouped[key]['images'][corr_key] = rel_path
+                        images[corr_key] = rel_path
                 elif 'cycle' in parsed:
                     # Cycle-based image (for preprocess pipeline)
                     cycle = parsed['cycle']
                     channel = parsed['channel']
                     cycle_channel_key = f"Cycle{cycle}_{channel}"
-                    grouped[key]['images'][cycle_channel_key] = rel_path
+                    images[cycle_channel_key] = rel_path
                 else:
                     # Single-channel image
                     channel = parsed['channel']
-                    grouped[key]['images'][channel] = rel_path
-            except KeyError as e:
-                missing_metadata.append((filename, f"Missing channel information: {e}"))
-                print(f"⚠ Error processing '{filename}': Missing channel information: {e}", file=sys.stderr)
-                continue
+                    images[channel] = rel_path
+        finally:
+            if warning_lines:
+                sys.stderr.write(''.join(warning_lines))
 
     # Report parsing summary
     if parse_errors:
@@ -888,18 +1020,25 @@ def collect_and_group_files(
     # Post-process for multi-cycle: assign images to cycles by sorted order
     if metadata_cycles:
         print(f"✓ Processing multi-cycle with cycles: {metadata_cycles}", file=sys.stderr)
-        for key in list(grouped.keys()):
+        # Loop invariants: expected image count, cycle assignment order and the
+        # cycle set assigned to each group
+        n_cycles = len(metadata_cycles)
+        sorted_cycles = sorted(metadata_cycles)
+        cycles_set = set(metadata_cycles)
+        for key, group in grouped.items():
+            images = group['images']
+
             # Skip if already has cycle info
-            if '_files_by_cycle' in grouped[key]['images']:
+            if '_files_by_cycle' in images:
                 continue
 
             # Collect all stored images
-            if '_file' in grouped[key]['images']:
+            if '_file' in images:
                 # Single file entry - shouldn't happen in multi-cycle
                 continue
 
             # Get all non-underscore keys (image paths)
-            img_paths = [(k, v) for k, v in grouped[key]['images'].items() if not k.startswith('_')]
+            img_paths = [(k, v) for k, v in images.items() if not k.startswith('_')]
 
             if not img_paths:
                 continue
@@ -907,21 +1046,22 @@ def collect_and_group_files(
             # Sort and assign to cycles by order
             sorted_paths = sorted(img_paths, key=lambda x: x[1])
 
-            if len(sorted_paths) != len(metadata_cycles):
-                print(f"⚠ Expected {len(metadata_cycles)} images for {key}, found {len(sorted_paths)}", file=sys.stderr)
+            if len(sorted_paths) != n_cycles:
+                print(f"⚠ Expected {n_cycles} images for {key}, found {len(sorted_paths)}", file=sys.stderr)
                 continue
 
-            # Clear and recreate as _files_by_cycle
-            for k, _ in img_paths:
-                del grouped[key]['images'][k]
+            # Rebuild without the raw image paths (keeping '_' entries) and
+            # recreate as _files_by_cycle
+            files_by_cycle = {}
+            images = {k: v for k, v in images.items() if k.startswith('_')}
+            images['_files_by_cycle'] = files_by_cycle
+            group['images'] = images
+            group['cycles'] = cycles_set.copy()
 
-            grouped[key]['images']['_files_by_cycle'] = {}
-            grouped[key]['cycles'] = set(metadata_cycles)
-
-            for idx, cycle_num in enumerate(sorted(metadata_cycles)):
+            for idx, cycle_num in enumerate(sorted_cycles):
                 img_path = sorted_paths[idx][1]
                 # No parsing needed - just store the file path
-                grouped[key]['images']['_files_by_cycle'][cycle_num] = {
+                files_by_cycle[cycle_num] = {
                     'file': img_path
                 }
 
@@ -932,20 +1072,28 @@ def collect_and_group_files(
         if not os.path.isdir(illum_dir):
             raise FileNotFoundError(f"Illumination directory not found: {illum_dir}")
 
-        illum_pattern = os.path.join(illum_dir, "*.npy")
-        illum_files = glob.glob(illum_pattern)
+        # One directory listing; only names are needed since CSV rows store bare
+        # illum filenames (same selection as glob('*.npy'): hidden names skipped)
+        with os.scandir(illum_dir) as it:
+            illum_files = [
+                entry.name for entry in it
+                if entry.name.endswith('.npy') and not entry.name.startswith('.')
+            ]
 
         if not illum_files:
             raise ValueError(f"No illumination files (*.npy) found in {illum_dir}")
 
         print(f"✓ Found {len(illum_files)} illumination file(s)", file=sys.stderr)
 
-        illum_matched = 0
-        for illum_path in illum_files:
-            filename = os.path.basename(illum_path)
+        # Index group keys by plate once so each illum file only visits its own plate
+        groups_by_plate = {}
+        for key in grouped:
+            groups_by_plate.setdefault(key[0], []).append(key)
 
+        illum_matched = 0
+        for filename in illum_files:
             # Try cycle-based pattern first: Plate1_Cycle01_IllumChannelName.npy
-            cycle_match = re.match(r'(.+?)_Cycle(\d+)_Illum(.+?)\.npy', filename)
+            cycle_match = _ILLUM_CYCLE_RE.match(filename)
             if cycle_match:
                 plate = cycle_match.group(1)
                 file_cycle = int(cycle_match.group(2))
@@ -957,35 +1105,32 @@ def collect_and_group_files(
                     continue
 
                 # Add to all entries for this plate
-                matched_this_file = False
-                for (p, w, s) in grouped.keys():
-                    if p == plate:
-                        # Store illum files by cycle if we have multiple cycles
-                        if '_by_cycle' not in grouped[(p, w, s)]['illum']:
-                            grouped[(p, w, s)]['illum']['_by_cycle'] = {}
-                        if file_cycle not in grouped[(p, w, s)]['illum']['_by_cycle']:
-                            grouped[(p, w, s)]['illum']['_by_cycle'][file_cycle] = {}
-                        grouped[(p, w, s)]['illum']['_by_cycle'][file_cycle][channel] = filename
-                        matched_this_file = True
-
-                if matched_this_file:
+                plate_keys = groups_by_plate.get(plate, ())
+                for key in plate_keys:
+                    # Store illum files by cycle if we have multiple cycles
+                    illum_by_cycle = grouped[key]['illum'].setdefault('_by_cycle', {})
+                    illum_by_cycle.setdefault(file_cycle, {})[channel] = filename
+
+                if plate_keys:
                     illum_matched += 1
+                    if out_illum is not None:
+                        out_illum.add(filename)
             else:
                 # Try non-cycle pattern: Plate1_IllumChannelName.npy
-                match = re.match(r'(.+?)_Illum(.+?)\.npy', filename)
+                match = _ILLUM_RE.match(filename)
                 if match:
                     plate = match.group(1)
                     channel = match.group(2)
 
                     # Add to all entries for this plate
-                    matched_this_file = False
-                    for (p, w, s) in grouped.keys():
-                        if p == plate:
-                            grouped[(p, w, s)]['illum'][channel] = filename
-                            matched_this_file = True
+                    plate_keys = groups_by_plate.get(plate, ())
+                    for key in plate_keys:
+                        grouped[key]['illum'][channel] = filename
 
-                    if matched_this_file:
+                    if plate_keys:
                         illum_matched += 1
+                        if out_illum is not None:
+                            out_illum.add(filename)
                 else:
                     print(f"⚠ Illumination file '{filename}' does not match expected pattern", file=sys.stderr)
 
@@ -993,29 +1138,54 @@ def collect_and_group_files(
 
     # Normalize single-cycle data: if images are in _files_by_cycle format with only one cycle,
     # check if illum files are in non-cycle format and convert them to match
-    for key in grouped.keys():
-        if '_files_by_cycle' in grouped[key]['images']:
-            cycles_list = list(grouped[key]['images']['_files_by_cycle'].keys())
+    for key, group in grouped.items():
+        if '_files_by_cycle' in group['images']:
+            cycles_list = list(group['images']['_files_by_cycle'].keys())
             if len(cycles_list) == 1:
                 # Single cycle - check if illum files need conversion
                 cycle_num = cycles_list[0]
+                illum = group['illum']
                 # Check if we have non-cycle illum files (direct channel mapping)
                 has_non_cycle_illum = any(
-                    k for k in grouped[key]['illum'].keys()
+                    k for k in illum.keys()
                     if not k.startswith('_')
                 )
-                if has_non_cycle_illum and '_by_cycle' not in grouped[key]['illum']:
+                if has_non_cycle_illum and '_by_cycle' not in illum:
                     # Convert non-cycle illum files to _by_cycle format
-                    direct_illum = {k: v for k, v in grouped[key]['illum'].items() if not k.startswith('_')}
-                    grouped[key]['illum']['_by_cycle'] = {cycle_num: direct_illum}
+                    direct_illum = {k: v for k, v in illum.items() if not k.startswith('_')}
+                    illum['_by_cycle'] = {cycle_num: direct_illum}
                     # Remove direct entries
                     for channel in direct_illum.keys():
-                        del grouped[key]['illum'][channel]
+                        del illum[channel]
                     print(f"✓ Normalized single-cycle illum files for {key}", file=sys.stderr)
 
     return grouped
 
 
+@functools.lru_cache(maxsize=None)
+def _channel_columns(channels: Tuple[str, ...], cycle_str: Optional[str] = None) -> Tuple[Tuple, ...]:
+    """
+    Build the per-channel column names for multi-channel image rows.
+
+    Memoized: column names are identical for every row with the same channels
+    and cycle prefix, so each combination is formatted once.
+
+    Args:
+        channels: Channel names, in frame order
+        cycle_str: Zero-padded cycle number for cycle-prefixed columns (e.g. "01"),
+            or None for unprefixed columns
+
+    Returns:
+        Tuple of (channel, frame_idx, FileName column, Frame column, Illum FileName column)
+    """
+    prefix = f"Cycle{cycle_str}_" if cycle_str is not None else ""
+    return tuple(
+        (channel, frame_idx,
+         f'FileName_{prefix}Orig{channel}', f'Frame_{prefix}Orig{channel}', f'FileName_{prefix}Illum{channel}')
+        for frame_idx, channel in enumerate(channels)
+    )
+
+
 def generate_csv_rows(
     grouped: Dict,
     pipeline_type: str,
@@ -1024,7 +1194,8 @@ def generate_csv_rows(
     has_cycles: bool = False,
     metadata_cycle: Optional[int] = None,
     metadata_json: Dict = None,
-    cycle_metadata_name: str = "Cycle"
+    cycle_metadata_name: str = "Cycle",
+    out_images: Optional[set] = None
 ) -> List[Dict]:
     """
     Generate CellProfiler load_data.csv rows from grouped file data.
@@ -1054,6 +1225,8 @@ def generate_csv_rows(
         has_cycles: Whether data contains cycle information (for barcoding workflows)
         metadata_cycle: Cycle number for single-cycle processing
         metadata_json: Metadata dict from JSON file (REQUIRED - source of all metadata)
+        out_images: Optional set that receives the image filenames referenced by the
+            generated rows (illumination files excluded)
 
     Returns:
         List of dict, where each dict is one CSV row with column names as keys
@@ -1112,64 +1285,86 @@ def generate_csv_rows(
             wells_to_sites[well_key] = []
         wells_to_sites[well_key].append(site)
 
-    # For each well, select every nth site (or all sites if fewer than range_skip)
-    selected_keys = set()
-    for well_key, sites in wells_to_sites.items():
-        sorted_sites = sorted(sites)
+    # For each well, select every nth site (or all sites if fewer than range_skip).
+    # Wells are visited in sorted order and sites are sorted within each well, so
+    # selected_keys comes out in (plate, well, site) order without a global sort.
+    selected_keys = []
+    for well_key in sorted(wells_to_sites):
+        sorted_sites = sorted(wells_to_sites[well_key])
         # If well has fewer sites than range_skip, use all sites
         if len(sorted_sites) < range_skip:
             selected_sites = sorted_sites
         else:
-            selected_sites = [site for i, site in enumerate(sorted_sites) if i % range_skip == 0]
+            selected_sites = sorted_sites[::range_skip]
 
-        for site in selected_sites:
-            selected_keys.add((well_key[0], well_key[1], site))
+        plate, well = well_key
+        selected_keys.extend((plate, well, site) for site in selected_sites)
 
     total_sites = len(grouped.keys())
     print(f"✓ Selected {len(selected_keys)} image(s) from {total_sites} total images across {len(wells_to_sites)} well(s)", file=sys.stderr)
 
+    # Metadata values that are identical for every row are resolved once here and
+    # copied into each row; only plate/well/site vary per row.
+    # Metadata_Cycle (or custom cycle column name) is only added for barcoding workflows.
+    meta_template = {}
+    if has_cycles and has_cycle:
+        cycle_col_name = f'Metadata_{cycle_metadata_name}'
+        meta_template[cycle_col_name] = metadata_json['cycle'] if 'cycle' in metadata_json else metadata_cycle
+
+    # Channels for multi-channel files: JSON metadata first, then CLI args.
+    # None means neither source provided them; rows that need channels report it.
+    if 'channels' in metadata_json:
+        channels_to_use = metadata_json['channels']
+    else:
+        channels_to_use = metadata_channels or None
+
+    # Set form for the illumination completeness checks (C-level subset test per row)
+    channels_set = frozenset(channels_to_use or ())
+    # Hashable form for the memoized per-channel column names
+    channels_key = tuple(channels_to_use or ())
+
+    # Cycle-specific column names for single multi-channel files
+    # (for illumapply with cycle-aware flag)
+    use_cycle_columns = config.get('cycle_aware', False) and metadata_cycle is not None
+    metadata_cycle_str = f"{metadata_cycle:02d}" if use_cycle_columns else None
+
+    # Per-pipeline settings checked for every row
+    include_illum = config['include_illum_files']
+    # Some pipelines (segcheck, preprocess) use Metadata_Well_Value as well
+    config_cols = config.get('metadata_cols', []) or config.get('metadata_cols_base', [])
+    emit_well_value = 'Metadata_Well_Value' in config_cols
+
     rows = []  # List of CSV row dicts
     row_errors = []  # Track rows that failed to generate
 
     # ==================================================================================
     # Generate one CSV row per (plate, well, site)
     # ==================================================================================
-    for (plate, well, site), file_data in sorted(grouped.items()):
-        # Skip images not selected by subsampling
-        if (plate, well, site) not in selected_keys:
-            continue
+    # Only selected keys are visited, already in sorted order
+    for plate, well, site in selected_keys:
+        file_data = grouped[(plate, well, site)]
 
         try:
             # ------------------------------------------------------------------
             # Build metadata columns (from JSON metadata)
             # ------------------------------------------------------------------
-            row = {}
+            row = meta_template.copy()
 
             # Always include Metadata_Plate (required in JSON)
             row['Metadata_Plate'] = plate
+            # Image files referenced by this row, recorded once the row is kept
+            row_images = []
 
             # Conditionally include Metadata_Well if present in JSON
             if has_well:
                 row['Metadata_Well'] = well
-                # Some pipelines (segcheck, preprocess) use Metadata_Well_Value as well
-                config_cols = config.get('metadata_cols', []) or config.get('metadata_cols_base', [])
-                if 'Metadata_Well_Value' in config_cols:
+                if emit_well_value:
                     row['Metadata_Well_Value'] = well
 
             # Conditionally include Metadata_Site if present in JSON
             if has_site:
                 row['Metadata_Site'] = site
 
-            # Conditionally include Metadata_Cycle (or custom cycle column name) for barcoding workflows
-            if has_cycles and has_cycle:
-                cycle_col_name = f'Metadata_{cycle_metadata_name}'
-                if 'cycle' in metadata_json:
-                    row[cycle_col_name] = metadata_json['cycle']
-                elif metadata_cycle is not None:
-                    row[cycle_col_name] = metadata_cycle
-                else:
-                    raise ValueError(f"{cycle_col_name} required but not found in metadata JSON or arguments")
-
             # ------------------------------------------------------------------
             # Build file columns (FileName_* and Frame_* columns)
             # Strategy depends on file organization pattern
@@ -1182,12 +1377,8 @@ def generate_csv_rows(
                 files_by_cycle = file_data['images']['_files_by_cycle']
                 illum_by_cycle = file_data['illum'].get('_by_cycle', {})
 
-                # Get channels from JSON metadata (required!)
-                if metadata_json and 'channels' in metadata_json:
-                    channels_to_use = metadata_json['channels']
-                elif metadata_channels:
-                    channels_to_use = metadata_channels
-                else:
+                # Channels are required for multi-channel files
+                if channels_to_use is None:
                     raise ValueError("Channels must be specified in JSON metadata or CLI args")
 
                 # Check if we have multiple cycles - if only one, don't use cycle prefix
@@ -1198,41 +1389,38 @@ def generate_csv_rows(
                 for cycle_num in sorted(files_by_cycle.keys()):
                     cycle_info = files_by_cycle[cycle_num]
                     filename = cycle_info['file']
-                    cycle_str = f"{cycle_num:02d}"
+                    cycle_illum = illum_by_cycle.get(cycle_num, {})
 
                     # Add FileName and Frame for each channel in this cycle
                     # Frame number is just the index in the channels list
-                    for frame_idx, channel in enumerate(channels_to_use):
-                        if use_cycle_prefix:
-                            row[f'FileName_Cycle{cycle_str}_Orig{channel}'] = filename
-                            row[f'Frame_Cycle{cycle_str}_Orig{channel}'] = frame_idx
-                        else:
-                            row[f'FileName_Orig{channel}'] = filename
-                            row[f'Frame_Orig{channel}'] = frame_idx
+                    column_key = f"{cycle_num:02d}" if use_cycle_prefix else None
+                    columns = _channel_columns(channels_key, column_key)
+                    if columns:
+                        row_images.append(filename)
+                    for channel, frame_idx, file_col, frame_col, illum_col in columns:
+                        row[file_col] = filename
+                        row[frame_col] = frame_idx
 
                         # Add illumination file if available for this cycle
-                        if cycle_num in illum_by_cycle and channel in illum_by_cycle[cycle_num]:
-                            if use_cycle_prefix:
-                                row[f'FileName_Cycle{cycle_str}_Illum{channel}'] = illum_by_cycle[cycle_num][channel]
-                            else:
-                                row[f'FileName_Illum{channel}'] = illum_by_cycle[cycle_num][channel]
+                        if channel in cycle_illum:
+                            row[illum_col] = cycle_illum[channel]
 
                     # Validate we have all required illumination files for this cycle
-                    if config['include_illum_files']:
+                    if include_illum:
                         if cycle_num not in illum_by_cycle:
                             print(
                                 f"⚠ Missing illumination files for cycle {cycle_num} "
                                 f"in {plate}/{well}/Site{site}",
                                 file=sys.stderr
                             )
-                        else:
+                        elif not illum_by_cycle[cycle_num].keys() >= channels_set:
+                            # Some channel is missing; list them in channel order for the report
                             missing_illum = [ch for ch in channels_to_use if ch not in illum_by_cycle[cycle_num]]
-                            if missing_illum:
-                                print(
-                                    f"⚠ Missing illumination files for channels {missing_illum} in cycle {cycle_num} "
-                                    f"in {plate}/{well}/Site{site}",
-                                    file=sys.stderr
-                                )
+                            print(
+                                f"⚠ Missing illumination files for channels {missing_illum} in cycle {cycle_num} "
+                                f"in {plate}/{well}/Site{site}",
+                                file=sys.stderr
+                            )
 
             # PATTERN 2: Single multi-channel file (e.g., one OME-TIFF with all channels)
             # (e.g., illumcalc without cycles, illumapply single cycle)
@@ -1241,48 +1429,36 @@ def generate_csv_rows(
                 # Example: WellA1_PointA1_0000_ChannelDNA,Phalloidin,CHN2_Seq0000.ome.tiff
                 filename = file_data['images']['_file']
 
-                # Get channels from JSON metadata (required!)
-                if metadata_json and 'channels' in metadata_json:
-                    channels_to_use = metadata_json['channels']
-                elif metadata_channels:
-                    channels_to_use = metadata_channels
-                else:
+                # Channels are required for multi-channel files
+                if channels_to_use is None:
                     raise ValueError("Channels must be specified in JSON metadata or CLI args")
 
-                # Determine if we need cycle-specific column names
-                # (for illumapply with cycle-aware flag)
-                use_cycle_columns = config.get('cycle_aware', False) and metadata_cycle is not None
-
                 # Add FileName and Frame for each channel
                 # All channels point to the same file, differentiated by Frame number
                 # Frame 0 = first channel, Frame 1 = second channel, etc.
-                for frame_idx, channel in enumerate(channels_to_use):
-                    # Generate column names with or without cycle prefix
-                    if use_cycle_columns:
-                        cycle_str = f"{metadata_cycle:02d}"
-                        row[f'FileName_Cycle{cycle_str}_Orig{channel}'] = filename
-                        row[f'Frame_Cycle{cycle_str}_Orig{channel}'] = frame_idx
-                    else:
-                        row[f'FileName_Orig{channel}'] = filename
-                        row[f'Frame_Orig{channel}'] = frame_idx
+                # Column names carry the cycle prefix only for cycle-aware pipelines
+                columns = _channel_columns(channels_key, metadata_cycle_str)
+                illum = file_data['illum']
+                if columns:
+                    row_images.append(filename)
+                for channel, frame_idx, file_col, frame_col, illum_col in columns:
+                    row[file_col] = filename
+                    row[frame_col] = frame_idx
 
                     # Add illumination file if available
                     # Match illumination files by channel name (they should use metadata channel names)
-                    if channel in file_data['illum']:
-                        if use_cycle_columns:
-                            row[f'FileName_Cycle{cycle_str}_Illum{channel}'] = file_data['illum'][channel]
-                        else:
-                            row[f'FileName_Illum{channel}'] = file_data['illum'][channel]
+                    if channel in illum:
+                        row[illum_col] = illum[channel]
 
                 # Validate we have all required illumination files
-                if config['include_illum_files']:
-                    missing_illum = [ch for ch in channels_to_use if ch not in file_data['illum']]
-                    if missing_illum:
-                        print(
-                            f"⚠ Missing illumination files for channels {missing_illum} "
-                            f"in {plate}/{well}/Site{site}",
-                            file=sys.stderr
-                        )
+                if include_illum and not illum.keys() >= channels_set:
+                    # Some channel is missing; list them in channel order for the report
+                    missing_illum = [ch for ch in channels_to_use if ch not in illum]
+                    print(
+                        f"⚠ Missing illumination files for channels {missing_illum} "
+                        f"in {plate}/{well}/Site{site}",
+                        file=sys.stderr
+                    )
             # PATTERN 3: Single-channel files or cycle-based files
             # (e.g., analysis, segcheck, preprocess, combined pipelines)
             else:
@@ -1293,27 +1469,19 @@ def generate_csv_rows(
                 if not file_data['images']:
                     raise ValueError(f"No image files for {plate}/{well}/Site{site}")
 
-                # For combined analysis, handle both cell painting and barcoding files
-                if pipeline_type == 'combined':
-                    # Add all files with their appropriate column names
-                    for key, filename in sorted(file_data['images'].items()):
-                        # Keys are like "Cycle01_A", "Cycle01_DNA", "CorrDNA", "CorrCHN2"
-                        row[f'FileName_{key}'] = filename
-                else:
-                    # Check if this is cycle-based (preprocess pipeline)
-                    is_cycle_based = any('Cycle' in key for key in file_data['images'].keys())
-
-                    if is_cycle_based:
-                        # For preprocess: add FileName_Cycle{cycle}_{channel} columns
-                        for cycle_channel_key, filename in sorted(file_data['images'].items()):
-                            # cycle_channel_key is like "Cycle01_A", "Cycle01_C", etc.
-                            row[f'FileName_{cycle_channel_key}'] = filename
-                    else:
-                        # For other pipelines: add FileName_{channel} columns
-                        for channel, filename in sorted(file_data['images'].items()):
-                            row[f'FileName_{channel}'] = filename
+                # Image keys are already the column suffixes, whatever the pipeline:
+                #   - Combined: "Cycle01_A", "Cycle01_DNA", "CorrDNA", "CorrCHN2"
+                #   - Preprocess: "Cycle01_A", "Cycle01_C", etc. (FileName_Cycle{cycle}_{channel})
+                #   - Others: channel name (FileName_{channel})
+                # so no cycle-based check is needed per row.
+                # Column order is fixed by write_csv(), so no per-row sort is needed here
+                for key, filename in file_data['images'].items():
+                    row[f'FileName_{key}'] = filename
+                row_images = file_data['images'].values()
 
             rows.append(row)
+            if out_images is not None:
+                out_images.update(row_images)
 
         except (KeyError, ValueError) as e:
             row_errors.append((f"{plate}/{well}/Site{site}", str(e)))
@@ -1346,17 +1514,12 @@ def write_csv(rows: List[Dict], output_file: str, metadata_cols: Optional[List[s
     if not rows:
         raise ValueError("No rows to write - cannot create empty CSV")
 
-    # Get all column names from actual data
-    all_cols = set()
-    for row in rows:
-        all_cols.update(row.keys())
-
-    # Separate metadata columns (start with Metadata_) from file columns
-    actual_metadata_cols = sorted([c for c in all_cols if c.startswith('Metadata_')])
-    file_cols = sorted([c for c in all_cols if not c.startswith('Metadata_')])
+    # Get all column names from actual data (one set union over every row's keys)
+    all_cols = set().union(*rows)
 
-    # Order: metadata columns first, then sorted FileName/Frame columns
-    fieldnames = actual_metadata_cols + file_cols
+    # Order: metadata columns (start with Metadata_) first, then sorted
+    # FileName/Frame columns - a single sort on (non-metadata, name)
+    fieldnames = sorted(all_cols, key=lambda c: (not c.startswith('Metadata_'), c))
 
     # Validation: warn if expected metadata columns are missing
     if metadata_cols:
@@ -1370,10 +1533,13 @@ def write_csv(rows: List[Dict], output_file: str, metadata_cols: Optional[List[s
     print(f"✓ Writing CSV with {len(fieldnames)} columns: {', '.join(fieldnames)}", file=sys.stderr)
 
     try:
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
+        # Large write buffer so big plates go out in few write() calls; rows are
+        # streamed to csv.writer as positional lists (missing columns are empty).
+        # UTF-8 is explicit so the codec does not depend on the container locale.
+        with open(output_file, 'w', newline='', encoding='utf-8', buffering=_CSV_WRITE_BUFFER) as f:
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows([row.get(col, '') for col in fieldnames] for row in rows)
     except IOError as e:
         raise IOError(f"Failed to write CSV to {output_file}: {e}")
     except Exception as e:
@@ -1382,6 +1548,18 @@ def write_csv(rows: List[Dict], output_file: str, metadata_cols: Optional[List[s
     print(f"✓ Successfully generated {output_file} with {len(rows)} rows")
 
 
+def _emit_error(title: str, detail: str) -> None:
+    """
+    Report an error to stderr as a single write.
+
+    Args:
+        title: Error category shown after the ERROR marker
+        detail: Error message, indented on the following line
+    """
+    sys.stderr.write(f"\n❌ ERROR: {title}\n   {detail}\n")
+    sys.stderr.flush()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Generate load_data.csv for CellProfiler pipelines'
@@ -1461,9 +1639,9 @@ def main():
     if config['include_illum_files'] and not args.illum_dir:
         parser.error(f"--illum-dir required for pipeline type '{args.pipeline_type}'")
 
-    print(f"\n{'='*60}", file=sys.stderr)
+    print(f"\n{_BANNER}", file=sys.stderr)
     print(f"CellProfiler load_data.csv Generator", file=sys.stderr)
-    print(f"{'='*60}", file=sys.stderr)
+    print(_BANNER, file=sys.stderr)
     print(f"Pipeline type: {args.pipeline_type}", file=sys.stderr)
     print(f"Description: {config['description']}", file=sys.stderr)
     print(f"Images directory: {args.images_dir}", file=sys.stderr)
@@ -1472,7 +1650,7 @@ def main():
     if args.range_skip > 1:
         print(f"Subsampling: every {args.range_skip} sites", file=sys.stderr)
     print(f"Output file: {args.output}", file=sys.stderr)
-    print(f"{'='*60}\n", file=sys.stderr)
+    print(f"{_BANNER}\n", file=sys.stderr)
 
     try:
         # Load and validate metadata JSON (REQUIRED)
@@ -1516,19 +1694,25 @@ def main():
             metadata_cycles = metadata_json['cycles']
             print(f"✓ Using cycles from JSON metadata: {metadata_cycles}", file=sys.stderr)
 
-        # Collect and group files
+        # Collect and group files, recording matched illumination files for the
+        # file list output
         print(f"\nStep 1/4: Collecting and grouping files...", file=sys.stderr)
+        illum_files = set()
         grouped = collect_and_group_files(
             args.images_dir,
             args.pipeline_type,
             args.illum_dir,
             metadata_cycle,
             metadata_cycles,
-            metadata_json
+            metadata_json,
+            illum_files if args.output_file_list else None
         )
 
-        # Generate rows
+        # Generate rows, collecting the image filenames they reference.
+        # They are only read with --use-subdirs (subdirectory staging and the file
+        # list's image entries), so collection is skipped otherwise.
         print(f"\nStep 2/4: Generating CSV rows...", file=sys.stderr)
+        all_images = set()
         rows = generate_csv_rows(
             grouped,
             args.pipeline_type,
@@ -1537,34 +1721,32 @@ def main():
             args.has_cycles,
             metadata_cycle,
             metadata_json,
-            args.cycle_metadata_name
+            args.cycle_metadata_name,
+            all_images if args.use_subdirs else None
         )
 
         # Apply subdirectory staging if requested
         subdir_map = {}
-        all_images = set()
-
-        # Collect all image filenames from rows (needed for file list output)
-        for row in rows:
-            for key, value in row.items():
-                if key.startswith('FileName_') and value:
-                    # Remove quotes if present
-                    filename = value.strip('"')
-                    if filename and not filename.endswith('.npy'):
-                        all_images.add(filename)
 
         if args.use_subdirs and config.get('supports_subdirs', False):
             print(f"\nStep 3/4: Applying subdirectory staging...", file=sys.stderr)
-            subdir_map = assign_subdirectories(list(all_images))
+            subdir_map = assign_subdirectories(all_images)
             print(f"✓ Assigned {len(subdir_map)} images to subdirectories", file=sys.stderr)
 
             # Update filenames in rows with subdirectory prefix
+            # (values are left unquoted; csv.writer quotes them if needed)
+            # FileName_ columns across all rows, found once rather than per row
+            filename_keys = tuple(k for k in set().union(*rows) if k.startswith('FileName_'))
+            # Prefixed names built once per image (multi-channel files fill several
+            # columns of every row with the same name)
+            staged_names = {
+                filename: f"{subdir}/{filename}" for filename, subdir in subdir_map.items()
+            }
             for row in rows:
-                for key in list(row.keys()):
-                    if key.startswith('FileName_') and row[key]:
-                        filename = row[key].strip('"')
-                        if filename in subdir_map:
-                            row[key] = f'"{subdir_map[filename]}/{filename}"'
+                for key in filename_keys:
+                    staged = staged_names.get(row.get(key))
+                    if staged:
+                        row[key] = staged
         else:
             print(f"\nStep 3/4: Skipping subdirectory staging (not enabled or not supported)", file=sys.stderr)
 
@@ -1587,51 +1769,30 @@ def main():
             file_list_data = {
                 'images': sorted(all_images) if args.use_subdirs else [],
                 'subdirs': subdir_map if args.use_subdirs else {},
-                'illumination': []
+                'illumination': sorted(illum_files)
             }
 
-            # Collect illumination files from grouped data
-            for file_data in grouped.values():
-                if 'illum' in file_data and file_data['illum']:
-                    file_list_data['illumination'].extend(file_data['illum'].values())
-
-            file_list_data['illumination'] = sorted(set(file_list_data['illumination']))
-
             with open(args.output_file_list, 'w') as f:
                 json.dump(file_list_data, f, indent=2)
 
             print(f"✓ Wrote file list to {args.output_file_list}", file=sys.stderr)
 
-        print(f"\n{'='*60}", file=sys.stderr)
-        print(f"✓ SUCCESS: CSV generation completed", file=sys.stderr)
-        print(f"{'='*60}\n", file=sys.stderr)
+        sys.stderr.write(_SUCCESS_BLOCK)
 
         return 0
 
-    except FileNotFoundError as e:
-        print(f"\n❌ ERROR: File or directory not found", file=sys.stderr)
-        print(f"   {e}", file=sys.stderr)
-        return 1
-    except ValueError as e:
-        print(f"\n❌ ERROR: Invalid data or configuration", file=sys.stderr)
-        print(f"   {e}", file=sys.stderr)
-        return 1
-    except IOError as e:
-        print(f"\n❌ ERROR: File I/O error", file=sys.stderr)
-        print(f"   {e}", file=sys.stderr)
-        return 1
-    except KeyError as e:
-        print(f"\n❌ ERROR: Missing required metadata field", file=sys.stderr)
-        print(f"   {e}", file=sys.stderr)
-        return 1
     except Exception as e:
-        print(f"\n❌ ERROR: Unexpected error occurred", file=sys.stderr)
-        print(f"   {type(e).__name__}: {e}", file=sys.stderr)
-        import traceback
-        print(f"\nTraceback:", file=sys.stderr)
-        traceback.print_exc()
+        for exc_type, title in _ERROR_TITLES:
+            if isinstance(e, exc_type):
+                _emit_error(title, str(e))
+                return 1
+        tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+        _emit_error(
+            "Unexpected error occurred",
+            f"{type(e).__name__}: {e}\n\nTraceback:\n{tb.rstrip()}"
+        )
         return 1
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    raise SystemExit(main())